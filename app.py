@@ -1,15 +1,28 @@
 import os
 import secrets
 import ast
-import traceback
-from flask import Flask, redirect, render_template, url_for, session, request
+import re
+import logging
+import hashlib
+import pickle
+import tempfile
+import functools
+import threading
+import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from flask import Flask, Response, redirect, render_template, url_for, session, request, stream_with_context
 from flask_dance.contrib.google import make_google_blueprint, google
+from markupsafe import escape
 import firebase_admin
 from firebase_admin import credentials, firestore
 import google.generativeai as genai
 from dotenv import load_dotenv
 from oauthlib.oauth2.rfc6749.errors import TokenExpiredError
 
+logger = logging.getLogger(__name__)
+
 # --- Load .env file ---
 load_dotenv()
 
@@ -19,6 +32,10 @@ GOOGLE_OAUTH_CLIENT_ID = os.getenv("GOOGLE_OAUTH_CLIENT_ID")
 GOOGLE_OAUTH_CLIENT_SECRET = os.getenv("GOOGLE_OAUTH_CLIENT_SECRET")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH")
+# Reuse Gemini responses for identical prompts (development only)
+CACHE_GEMINI = os.getenv("CACHE_GEMINI", "").lower() in ("1", "true", "yes")
+# Persist parsed flowcharts to disk as well as memory (unbounded, so opt-in)
+CACHE_FLOWCHARTS = os.getenv("CACHE_FLOWCHARTS", "").lower() in ("1", "true", "yes")
 
 # Allow insecure transport for local development
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
@@ -28,15 +45,28 @@ app = Flask(__name__)
 app.secret_key = FLASK_SECRET_KEY
 
 # --- Firebase Setup ---
-try:
-    if not FIREBASE_KEY_PATH:
-        raise ValueError("FIREBASE_KEY_PATH environment variable not set.")
-    cred = credentials.Certificate(FIREBASE_KEY_PATH)
-    firebase_admin.initialize_app(cred)
-    db = firestore.client()
-except Exception as e:
-    print(f"Firebase initialization error: {e}")
-    db = None
+# Initialized on first use so routes that never touch Firestore skip the
+# certificate load and client setup; get_db() returns None if it failed
+_db = None
+_db_initialized = False
+_db_lock = threading.Lock()
+
+def get_db():
+    global _db, _db_initialized
+    if _db_initialized:
+        return _db
+    with _db_lock:
+        if not _db_initialized:
+            try:
+                if not FIREBASE_KEY_PATH:
+                    raise ValueError("FIREBASE_KEY_PATH environment variable not set.")
+                cred = credentials.Certificate(FIREBASE_KEY_PATH)
+                firebase_admin.initialize_app(cred)
+                _db = firestore.client()
+            except Exception as e:
+                print(f"Firebase initialization error: {e}")
+            _db_initialized = True
+    return _db
 
 # --- Google OAuth Setup ---
 app.config["GOOGLE_OAUTH_CLIENT_ID"] = GOOGLE_OAUTH_CLIENT_ID
@@ -54,26 +84,147 @@ app.register_blueprint(blueprint, url_prefix="/login")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY environment variable not set.")
 genai.configure(api_key=GEMINI_API_KEY)
+_MODEL = genai.GenerativeModel("gemini-2.5-pro")
+
+# --- Cache Setup ---
+# Bump a cache's version whenever the shape of its cached results changes
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+AST_CACHE_DIR = os.path.join(APP_DIR, "ast-cache")
+AST_CACHE_VERSION = 4
+GEMINI_CACHE_DIR = os.path.join(APP_DIR, "gemini-cache")
+GEMINI_CACHE_VERSION = 1
+
+# Firestore profiles and Google userinfo are reused for this many seconds
+USER_CACHE_TTL = 300
+_USER_CACHE = TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+_USER_CACHE_LOCK = threading.Lock()
+# Background threads for Firestore reads that overlap other network calls
+_FIRESTORE_POOL = ThreadPoolExecutor(max_workers=4)
+
+
+# ==============================================================================
+# DISK CACHE HELPERS
+# ==============================================================================
+def read_disk_cache(cache_dir, version, key):
+    cache_path = os.path.join(cache_dir, f"{key}.pkl")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as f:
+            cached_version, result = pickle.load(f)
+        return result if cached_version == version else None
+    except Exception as e:
+        print(f"Error reading cache {cache_path}: {e}")
+        return None
+
+def write_disk_cache(cache_dir, version, key, result):
+    cache_path = os.path.join(cache_dir, f"{key}.pkl")
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # A unique temp file per write, so concurrent requests never share one
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((version, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Error writing cache {cache_path}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 
+# ==============================================================================
+# HELPER FUNCTION TO CALL GEMINI
+# ==============================================================================
+def generate_code_text(gemini_prompt):
+    if not CACHE_GEMINI:
+        return _MODEL.generate_content(gemini_prompt).text
+    prompt_hash = hashlib.sha256(gemini_prompt.encode()).hexdigest()
+    return _gen_code(prompt_hash, gemini_prompt)
+
+@functools.lru_cache(maxsize=256)
+def _gen_code(prompt_hash, gemini_prompt):
+    text = read_disk_cache(GEMINI_CACHE_DIR, GEMINI_CACHE_VERSION, prompt_hash)
+    if text is None:
+        text = _MODEL.generate_content(gemini_prompt).text
+        write_disk_cache(GEMINI_CACHE_DIR, GEMINI_CACHE_VERSION, prompt_hash, text)
+    return text
+
+# Shown in place of code when Gemini returns an empty response
+NO_CODE_GENERATED = "No code generated."
+
+# Markdown code fences Gemini sometimes wraps its answer in
+_MD_FENCE = re.compile(r"```(?:python)?\n?")
+
+def stream_code_text(gemini_prompt):
+    # Cached responses are already complete, so they are "streamed" in one piece
+    if CACHE_GEMINI:
+        return [generate_code_text(gemini_prompt)]
+    response = _MODEL.generate_content(gemini_prompt, stream=True)
+    return (chunk.text for chunk in response)
+
+def strip_code_fences(chunks):
+    # Streaming equivalent of _MD_FENCE.sub("", text).strip(). Trailing
+    # characters that could belong to a fence split across chunks are held
+    # back, as is trailing whitespace until more code follows it.
+    pending, held_ws, started = "", "", False
+    def clean(segment):
+        nonlocal held_ws, started
+        text = held_ws + _MD_FENCE.sub("", segment)
+        if not started: text = text.lstrip()
+        body = text.rstrip()
+        held_ws = text[len(body):]
+        if body: started = True
+        return body
+    for chunk in chunks:
+        pending += chunk
+        cut = len(pending)
+        while cut and pending[cut - 1] in "`python": cut -= 1
+        if cut:
+            body = clean(pending[:cut])
+            pending = pending[cut:]
+            if body: yield body
+    body = clean(pending)
+    if body: yield body
+    if not started: yield NO_CODE_GENERATED
+
 # ==============================================================================
 # HELPER FUNCTION TO SYNC GOOGLE USER WITH FIREBASE
 # ==============================================================================
-def sync_firebase_user(google_user_info):
+# Starts reading the user's Firestore document in the background
+def prefetch_firebase_user(uid):
+    if not uid:
+        return None
+    db = get_db()
+    if not db:
+        return None
+    with _USER_CACHE_LOCK:
+        if uid in _USER_CACHE:
+            return None
+    return _FIRESTORE_POOL.submit(db.collection('users').document(uid).get)
+
+def sync_firebase_user(google_user_info, user_doc_future=None):
+    db = get_db()
     if not db or not google_user_info or 'id' not in google_user_info:
         return google_user_info
     uid = google_user_info['id']
+    with _USER_CACHE_LOCK:
+        cached_user = _USER_CACHE.get(uid)
+    if cached_user is not None:
+        return cached_user
     email = google_user_info.get('email')
     name = google_user_info.get('name')
     user_ref = db.collection('users').document(uid)
     try:
-        user_doc = user_ref.get()
+        user_doc = user_doc_future.result() if user_doc_future else user_ref.get()
         if user_doc.exists:
-            return user_doc.to_dict()
+            user_data = user_doc.to_dict()
         else:
             user_data = {'name': name, 'email': email, 'uid': uid}
             user_ref.set(user_data)
-            return user_data
+        with _USER_CACHE_LOCK:
+            _USER_CACHE[uid] = user_data
+        return user_data
     except Exception as e:
         print(f"Error interacting with Firestore: {e}")
         return google_user_info
@@ -82,151 +233,258 @@ def sync_firebase_user(google_user_info):
 # ==============================================================================
 # ADVANCED FLOWCHART PARSER
 # ==============================================================================
+# Characters that would break out of a quoted mermaid node label
+_ESCAPE = str.maketrans({'"': '&quot;'})
+
+# Mermaid node shapes as (opening, closing) delimiters
+SHAPE_IO = ("[/", "/]")
+SHAPE_PROC = ("[", "]")
+SHAPE_COND = ("{", "}")
+SHAPE_TERM = ("((", "))")
+SHAPE_LOOP = ("{{", "}}")
+SHAPE_FUNC = ("[[", "]]")
+SHAPE_RET = ("(", ")")
+
+_IO_FUNCTIONS = frozenset(("input", "print"))
+_CALL, _NAME = ast.Call, ast.Name
+
+# Precomputed charts for inputs that never need parsing
+EMPTY_FLOWCHART = 'graph TD\n    N0(("Start"))\n    N1(("End"))\n    N0 --> N1\n'
+ERROR_FLOWCHART = "graph TD\n    A[Error: Could not parse code]"
+
 def generate_mermaid_flowchart(code):
+    if not code or code.isspace():
+        return EMPTY_FLOWCHART
+    if code == NO_CODE_GENERATED:
+        return ERROR_FLOWCHART
     try:
-        nodes, edges = parse_code_to_ast(code)
-        mermaid_string = "graph TD\n"
-        for node_id, data in nodes.items():
-            label = data['label'].replace('"', '&quot;')
-            shape_start, shape_end = data['shape']
-            mermaid_string += f'    {node_id}{shape_start}"{label}"{shape_end}\n'
-        for src, tgt, label in edges:
-            if src and tgt: # Ensure both source and target nodes exist
-                if label:
-                    mermaid_string += f'    {src} -->|{label}| {tgt}\n'
-                else:
-                    mermaid_string += f'    {src} --> {tgt}\n'
-        return mermaid_string
-    except Exception as e:
-        print(f"Error parsing code for flowchart: {e}\n{traceback.format_exc()}")
-        return "graph TD\n    A[Error: Could not parse code]"
-
-def parse_code_to_ast(code):
-    tree = ast.parse(code)
-    nodes, edges, functions, node_counter = {}, [], {}, 0
-    def get_node_id():
-        nonlocal node_counter
-        node_id = f"N{node_counter}"; node_counter += 1
-        return node_id
-    def add_node(label, shape):
-        node_id = get_node_id()
-        nodes[node_id] = {"label": label, "shape": shape}
+        labels, shape_starts, shape_ends, edge_srcs, edge_tgts, edge_labels = cached_parse_code_to_ast(code)
+        parts = ["graph TD"]
+        for i, (label, shape_start, shape_end) in enumerate(zip(labels, shape_starts, shape_ends)):
+            parts.append(f'    N{i}{shape_start}"{label.translate(_ESCAPE)}"{shape_end}')
+        for src, tgt, label in zip(edge_srcs, edge_tgts, edge_labels):
+            if label:
+                parts.append(f'    N{src} -->|{label}| N{tgt}')
+            else:
+                parts.append(f'    N{src} --> N{tgt}')
+        return "\n".join(parts) + "\n"
+    except Exception:
+        logger.exception("Flowchart parse failed")
+        return ERROR_FLOWCHART
+
+def cached_parse_code_to_ast(code):
+    code_hash = hashlib.sha256(code.encode()).hexdigest()
+    return _load_parsed_code(code_hash, code)
+
+@functools.lru_cache(maxsize=512)
+def _load_parsed_code(code_hash, code):
+    if not CACHE_FLOWCHARTS:
+        return parse_code_to_ast(code)
+    result = read_disk_cache(AST_CACHE_DIR, AST_CACHE_VERSION, code_hash)
+    if result is None:
+        result = parse_code_to_ast(code)
+        write_disk_cache(AST_CACHE_DIR, AST_CACHE_VERSION, code_hash, result)
+    return result
+
+# Returned by visitors that pushed a block onto the work stack; the block's
+# on_done continuation supplies the id to resume from once it finishes
+_PENDING = object()
+
+class FlowchartGraph:
+    def __init__(self, code):
+        # Nodes are stored as parallel lists indexed by integer node id
+        self.labels, self.shape_starts, self.shape_ends = [], [], []
+        # Edges likewise, as parallel source/target/label lists
+        self.edge_srcs, self.edge_tgts, self.edge_labels = [], [], []
+        self.functions = {}
+        self.source_lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        # Statement blocks are walked with an explicit work stack instead of
+        # recursion. Each frame is [children, last_id, loop_start_id, loop_exit_id,
+        # on_done, guarded]; on_done receives the block's last id and returns the
+        # id to resume the enclosing block from (or _PENDING if it queued more work).
+        self.stack, self.expanding = [], set()
+        # Labels per AST node, so function bodies inlined at several call
+        # sites are only sliced/unparsed once
+        self.node_labels = {}
+
+    def add_node(self, label, shape):
+        node_id = len(self.labels)
+        self.labels.append(label)
+        self.shape_starts.append(shape[0])
+        self.shape_ends.append(shape[1])
         return node_id
-    def visit(node, parent_id, loop_start_id=None, loop_exit_id=None):
-        node_type = type(node)
 
-        if node_type in (ast.Assign, ast.AugAssign):
+    def add_edge(self, src, tgt, label=""):
+        # Statements visited after a terminal node (e.g. dead code after a
+        # return in an inlined function) have no source to connect from
+        if src is None:
+            return
+        self.edge_srcs.append(src)
+        self.edge_tgts.append(tgt)
+        self.edge_labels.append(label)
+
+    def label_of(self, node):
+        label = self.node_labels.get(node)
+        if label is not None:
+            return label
+        # Slice single-line nodes straight out of the source (col offsets are
+        # UTF-8 byte offsets); fall back to unparsing anything else
+        lineno = getattr(node, "lineno", None)
+        if lineno is not None and lineno == getattr(node, "end_lineno", None):
+            line = self.source_lines[lineno - 1].encode()
+            label = line[node.col_offset:node.end_col_offset].decode().strip()
+        else:
             label = ast.unparse(node).strip()
-            current_id = add_node(label, ("[/", "/]"))
-            edges.append((parent_id, current_id, ""))
-            return current_id
+        self.node_labels[node] = label
+        return label
+
+    def push_block(self, children, parent_id, loop_start_id, loop_exit_id, on_done, guarded=True):
+        self.stack.append([iter(children), parent_id, loop_start_id, loop_exit_id, on_done, guarded])
+
+    def walk(self, body, parent_id):
+        result, stack = [], self.stack
+        self.push_block(body, parent_id, None, None, result.append)
+        while stack:
+            frame = stack[-1]
+            children, last_id, loop_start_id, loop_exit_id, on_done, guarded = frame
+            if last_id is not None or not guarded:
+                child = next(children, None)
+                if child is not None:
+                    handler = _DISPATCH.get(type(child), _visit_generic)
+                    last_id = handler(self, child, last_id, loop_start_id, loop_exit_id)
+                    if last_id is not _PENDING: frame[1] = last_id
+                    continue
+            stack.pop()
+            last_id = on_done(last_id)
+            if last_id is not _PENDING and stack: stack[-1][1] = last_id
+        return result[0]
+
+
+def _visit_assign(graph, node, parent_id, loop_start_id, loop_exit_id):
+    current_id = graph.add_node(graph.label_of(node), SHAPE_IO)
+    graph.add_edge(parent_id, current_id)
+    return current_id
+
+def _visit_expr(graph, node, parent_id, loop_start_id, loop_exit_id):
+    label = graph.label_of(node)
+    shape = SHAPE_PROC
+    value = node.value
+    if isinstance(value, _CALL) and isinstance(value.func, _NAME):
+        func_id = value.func.id
+        if func_id in _IO_FUNCTIONS: shape = SHAPE_IO
+        elif func_id in graph.functions and func_id not in graph.expanding:
+            current_id = graph.add_node(label, shape)
+            graph.add_edge(parent_id, current_id)
+            # Inline the function body; recursive calls are drawn as a plain node
+            graph.expanding.add(func_id)
+            def after_call(last_node_in_func):
+                graph.expanding.discard(func_id)
+                return last_node_in_func
+            graph.push_block(graph.functions[func_id]["body"], current_id, loop_start_id, loop_exit_id, after_call, guarded=False)
+            return _PENDING
+    current_id = graph.add_node(label, shape)
+    graph.add_edge(parent_id, current_id)
+    return current_id
+
+def _visit_return(graph, node, parent_id, loop_start_id, loop_exit_id):
+    current_id = graph.add_node(graph.label_of(node), SHAPE_RET)
+    graph.add_edge(parent_id, current_id)
+    return None # Terminal node for this path
+
+def _visit_if(graph, node, parent_id, loop_start_id, loop_exit_id):
+    cond_id = graph.add_node(f"if {graph.label_of(node.test)}", SHAPE_COND)
+    graph.add_edge(parent_id, cond_id)
+
+    def after_false(true_end, false_end):
+        # If both branches terminate (e.g., return), there's no merge
+        if true_end is None and false_end is None: return None
         
-        elif node_type is ast.Expr:
-            label = ast.unparse(node).strip()
-            shape = ("[", "]")
-            if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name):
-                func_id = node.value.func.id
-                if func_id in ['input', 'print']: shape = ("[/", "/]")
-                elif func_id in functions:
-                    current_id = add_node(label, shape)
-                    edges.append((parent_id, current_id, ""))
-                    last_node_in_func = current_id
-                    for func_stmt in functions[func_id]["body"]:
-                        last_node_in_func = visit(func_stmt, last_node_in_func, loop_start_id, loop_exit_id)
-                    return last_node_in_func
-            current_id = add_node(label, shape)
-            edges.append((parent_id, current_id, ""))
-            return current_id
-
-        elif node_type is ast.Return:
-            label = ast.unparse(node).strip()
-            current_id = add_node(label, ("(", ")"))
-            edges.append((parent_id, current_id, ""))
-            return None # Terminal node for this path
-
-        elif node_type is ast.If:
-            label = f"if {ast.unparse(node.test).strip()}"
-            cond_id = add_node(label, ("{", "}"))
-            edges.append((parent_id, cond_id, ""))
-            
-            true_end = cond_id
-            for child in node.body:
-                if true_end: true_end = visit(child, true_end, loop_start_id, loop_exit_id)
-            
-            false_end = cond_id
-            if node.orelse:
-                for child in node.orelse:
-                    if false_end: false_end = visit(child, false_end, loop_start_id, loop_exit_id)
+        merge_id = graph.add_node(" ", SHAPE_TERM)
+        if true_end is not None: graph.add_edge(true_end, merge_id, "Yes")
+        if false_end is not None: graph.add_edge(false_end, merge_id, "No")
 
-            # If both branches terminate (e.g., return), there's no merge
-            if not true_end and not false_end: return None
-            
-            merge_id = add_node(" ", ("((", "))"))
-            if true_end: edges.append((true_end, merge_id, "Yes"))
-            if false_end: edges.append((false_end, merge_id, "No"))
-
-            # Handle case where one branch is empty
-            if not node.body: edges.append((cond_id, merge_id, "Yes"))
-            if not node.orelse: edges.append((cond_id, merge_id, "No"))
-            
-            return merge_id
-        
-        elif node_type in (ast.For, ast.While):
-            loop_type = "For" if node_type is ast.For else "While"
-            condition = ast.unparse(node.target if node_type is ast.For else node.test).strip()
-            label = f"{loop_type} {condition}"
-            loop_id = add_node(label, ("{{", "}}"))
-            edges.append((parent_id, loop_id, ""))
-            
-            after_loop_id = add_node(" ", ("((", "))"))
-            body_end = loop_id
-            for child in node.body:
-                if body_end: body_end = visit(child, body_end, loop_id, after_loop_id)
-
-            if body_end: edges.append((body_end, loop_id, "Loop"))
-            edges.append((loop_id, after_loop_id, "End Loop"))
-            return after_loop_id
-
-        elif node_type is ast.Break:
-            if loop_exit_id: edges.append((parent_id, loop_exit_id, "break"))
-            return None # Terminal node
-        
-        elif node_type is ast.Continue:
-            if loop_start_id: edges.append((parent_id, loop_start_id, "continue"))
-            return None # Terminal node
+        # Handle case where one branch is empty
+        if not node.body: graph.add_edge(cond_id, merge_id, "Yes")
+        if not node.orelse: graph.add_edge(cond_id, merge_id, "No")
         
-        last_id = parent_id
-        for child in ast.iter_child_nodes(node):
-            if last_id: last_id = visit(child, last_id, loop_start_id, loop_exit_id)
-        return last_id
+        return merge_id
+    def after_true(true_end):
+        graph.push_block(node.orelse, cond_id, loop_start_id, loop_exit_id,
+                         lambda false_end: after_false(true_end, false_end))
+        return _PENDING
+    graph.push_block(node.body, cond_id, loop_start_id, loop_exit_id, after_true)
+    return _PENDING
+
+def _visit_loop(graph, node, label, parent_id):
+    loop_id = graph.add_node(label, SHAPE_LOOP)
+    graph.add_edge(parent_id, loop_id)
     
+    after_loop_id = graph.add_node(" ", SHAPE_TERM)
+    def after_body(body_end):
+        if body_end is not None: graph.add_edge(body_end, loop_id, "Loop")
+        graph.add_edge(loop_id, after_loop_id, "End Loop")
+        return after_loop_id
+    graph.push_block(node.body, loop_id, loop_id, after_loop_id, after_body)
+    return _PENDING
+
+def _visit_for(graph, node, parent_id, loop_start_id, loop_exit_id):
+    return _visit_loop(graph, node, f"For {graph.label_of(node.target)}", parent_id)
+
+def _visit_while(graph, node, parent_id, loop_start_id, loop_exit_id):
+    return _visit_loop(graph, node, f"While {graph.label_of(node.test)}", parent_id)
+
+def _visit_break(graph, node, parent_id, loop_start_id, loop_exit_id):
+    if loop_exit_id is not None: graph.add_edge(parent_id, loop_exit_id, "break")
+    return None # Terminal node
+
+def _visit_continue(graph, node, parent_id, loop_start_id, loop_exit_id):
+    if loop_start_id is not None: graph.add_edge(parent_id, loop_start_id, "continue")
+    return None # Terminal node
+
+def _visit_generic(graph, node, parent_id, loop_start_id, loop_exit_id):
+    graph.push_block(ast.iter_child_nodes(node), parent_id, loop_start_id, loop_exit_id, lambda last_id: last_id)
+    return _PENDING
+
+_DISPATCH = {
+    ast.Assign: _visit_assign,
+    ast.AugAssign: _visit_assign,
+    ast.Expr: _visit_expr,
+    ast.Return: _visit_return,
+    ast.If: _visit_if,
+    ast.For: _visit_for,
+    ast.While: _visit_while,
+    ast.Break: _visit_break,
+    ast.Continue: _visit_continue,
+}
+
+def parse_code_to_ast(code):
+    tree = ast.parse(code)
+    graph = FlowchartGraph(code)
+    functions, main_body = graph.functions, []
+
     # --- Main Parsing Logic ---
     for node in tree.body:
-        if isinstance(node, ast.FunctionDef):
+        if type(node) is ast.FunctionDef:
             functions[node.name] = { "body": node.body, "args": [arg.arg for arg in node.args.args] }
+        else:
+            main_body.append(node)
             
-    start_id = add_node("Start", ("((", "))"))
+    start_id = graph.add_node("Start", SHAPE_TERM)
     last_node_id = start_id
     
-    main_body = [n for n in tree.body if not isinstance(n, ast.FunctionDef)]
-    
     if not main_body and functions:
-        first_func_name = list(functions.keys())[0]
+        first_func_name = next(iter(functions))
         func_def_label = f"def {first_func_name}(...)"
-        func_def_id = add_node(func_def_label, ("[[", "]]"))
-        edges.append((start_id, func_def_id, ""))
-        last_node_id = func_def_id
-        for node in functions[first_func_name]["body"]:
-            if last_node_id: last_node_id = visit(node, last_node_id)
+        func_def_id = graph.add_node(func_def_label, SHAPE_FUNC)
+        graph.add_edge(start_id, func_def_id)
+        last_node_id = graph.walk(functions[first_func_name]["body"], func_def_id)
     else:
-        for node in main_body:
-            if last_node_id: last_node_id = visit(node, last_node_id)
+        last_node_id = graph.walk(main_body, start_id)
         
-    end_id = add_node("End", ("((", "))"))
-    if last_node_id: edges.append((last_node_id, end_id, ""))
+    end_id = graph.add_node("End", SHAPE_TERM)
+    if last_node_id is not None: graph.add_edge(last_node_id, end_id)
     
-    return nodes, edges
-
+    return graph.labels, graph.shape_starts, graph.shape_ends, graph.edge_srcs, graph.edge_tgts, graph.edge_labels
 
 # ==============================================================================
 # --- Routes ---
@@ -235,11 +493,21 @@ def parse_code_to_ast(code):
 def index():
     if not google.authorized:
         return redirect(url_for("login"))
+    # Skip the userinfo + Firestore round-trips while the session copy is fresh
+    user = session.get('user')
+    if user and time.time() - session.get('user_fetched_at', 0) < USER_CACHE_TTL:
+        return render_template("index.html", user=user, response=None)
+    # Speculatively read the previously seen user's profile while userinfo loads
+    cached_uid = user.get('uid') if user else None
+    user_doc_future = prefetch_firebase_user(cached_uid)
     try:
         resp = google.get("/oauth2/v2/userinfo")
-        user_info_from_google = resp.json() if resp.ok else {}
-        user = sync_firebase_user(user_info_from_google)
+        user_info_from_google = orjson.loads(resp.content) if resp.ok else {}
+        if user_doc_future and user_info_from_google.get('id') != cached_uid:
+            user_doc_future = None
+        user = sync_firebase_user(user_info_from_google, user_doc_future)
         session['user'] = user
+        session['user_fetched_at'] = time.time()
         return render_template("index.html", user=user, response=None)
     except TokenExpiredError:
         session.clear()
@@ -249,6 +517,9 @@ def index():
 def login():
     return render_template("login.html")
 
+# Marks where streamed code is spliced into the rendered code.html page
+_CODE_PLACEHOLDER = "<!--code-stream-->"
+
 @app.route("/generate", methods=["POST"])
 def generate():
     user = session.get('user')
@@ -263,21 +534,28 @@ def generate():
         return render_template("index.html", user=user, response="⚠️ Please enter a prompt.")
 
     try:
-        model = genai.GenerativeModel("gemini-2.5-pro")
-
         if action == "code":
             gemini_prompt = f"Write only the python code for the following task, without comments, explanation, or markdown. Task: {prompt}"
-            response = model.generate_content(gemini_prompt)
-            code = response.text.strip().replace("```python", "").replace("```", "") if response.text else "No code generated."
-            return render_template("code.html", prompt=prompt, code=code, user=user)
+            chunks = stream_code_text(gemini_prompt)
+            # Send the page around the code block right away and fill the code in as it arrives
+            page = render_template("code.html", prompt=prompt, code=_CODE_PLACEHOLDER, user=user)
+            page_head, page_tail = page.split(_CODE_PLACEHOLDER, 1)
+            def stream_page():
+                yield page_head
+                try:
+                    yield from strip_code_fences(chunks)
+                except Exception as e:
+                    yield str(escape(f"⚠️ An error occurred: {str(e)}"))
+                yield page_tail
+            return Response(stream_with_context(stream_page()), mimetype='text/html')
 
         elif action == "flowchart":
             if code_from_form:
                 code = code_from_form
             else:
                 code_prompt = f"Write only the python code for the following task, without comments, explanation, or markdown. Task: {prompt}"
-                code_response = model.generate_content(code_prompt)
-                code = code_response.text.strip().replace("```python", "").replace("```", "") if code_response.text else "No code generated."
+                code_response_text = generate_code_text(code_prompt)
+                code = _MD_FENCE.sub("", code_response_text).strip() if code_response_text else NO_CODE_GENERATED
             
             flowchart = generate_mermaid_flowchart(code)
 